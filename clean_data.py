@@ -1,188 +1,514 @@
-import pandas as pd
+import argparse
+import bz2
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
+import duckdb
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import indexed_bzip2
+except ImportError:
+    indexed_bzip2 = None
+
+MARKET_COLUMNS = (
+    "market_id",
+    "publish_time",
+    "status",
+    "in_play",
+    "number_of_active_runners",
+    "total_matched",
+    "version",
+)
+RUNNER_STATIC_COLUMNS = (
+    "market_id",
+    "publish_time",
+    "runner_id",
+    "runner_name",
+    "status",
+    "removal_date",
+)
+MARKET_REFERENCE_COLUMNS = (
+    "market_id",
+    "event_id",
+    "event_name",
+    "event_type_id",
+    "market_name",
+    "market_type",
+    "market_time",
+    "venue",
+    "country_code",
+    "number_of_winners",
+)
+# Low-cardinality reference columns, stored as pandas categoricals.
+MARKET_REFERENCE_CATEGORIES = ("event_type_id", "market_type", "venue", "country_code")
+RUNNER_CHANGE_COLUMNS = (
+    "market_id",
+    "publish_time",
+    "runner_id",
+    "ltp",
+    "tv",
+    "batb",
+    "batl",
+    "spn",
+    "spf",
+)
+
+# Price rows go straight from the parsed lists into Arrow arrays, skipping the
+# pandas object columns entirely. Prices fit in float32 and selection ids in
+# uint32 (out-of-range ids raise rather than wrap). Amounts in £ stay float64
+# since float32 loses pennies above ~100k: that covers traded volume and the
+# batb/batl ladders, whose [level, price, size] rows share one element type.
+RUNNER_CHANGE_SCHEMA = pa.schema(
+    [
+        ("market_id", pa.string()),
+        ("publish_time", pa.timestamp("ms")),
+        ("runner_id", pa.uint32()),
+        ("ltp", pa.float32()),
+        ("tv", pa.float64()),
+        ("batb", pa.list_(pa.list_(pa.float64(), 3))),
+        ("batl", pa.list_(pa.list_(pa.float64(), 3))),
+        ("spn", pa.float32()),
+        ("spf", pa.float32()),
+    ]
+)
+
+SHARD_DIRS = ("markets", "runner_status", "market_reference", "runner_reference")
+
+# Bump whenever a shard or price file schema changes; a manifest written with a
+# different format is discarded so every day is rebuilt instead of merged.
+MANIFEST_FORMAT = 1
+
+_PQ_OPTS = dict(
+    compression="zstd",
+    compression_level=3,
+    use_dictionary=True,
+    row_group_size=50_000,
+)
+
+
+def _parse_records(
+    records, markets, runner_static, runner_changes, market_meta, runner_meta
+):
+    mr_id, mr_pt, mr_status, mr_inplay, mr_nar, mr_tm, mr_ver = markets
+    rs_mid, rs_pt, rs_id, rs_name, rs_status, rs_removal = runner_static
+    rc_mid, rc_pt, rc_id, rc_ltp, rc_tv, rc_batb, rc_batl, rc_spn, rc_spf = (
+        runner_changes
+    )
+
+    # Last stored state per market_id and per (market_id, runner_id).
+    last_state = {}
+
+    for rec in records:
+        # Heartbeats carry no mc, and anything that isn't an array can't be
+        # walked as market changes; one type check covers both.
+        mc_data = rec.get("mc")
+        if not isinstance(mc_data, list):
+            continue
+
+        publish_time = rec.get("pt")
+
+        for market in mc_data:
+            mget = market.get
+            market_id = mget("id")
+
+            mkt_def = mget("marketDefinition")
+            if mkt_def is not None:
+                dget = mkt_def.get
+
+                # Repeated definitions are dropped by the monthly dedupe anyway, so
+                # only keep a row when (status, in_play, version) has changed.
+                status = dget("status")
+                in_play = dget("inPlay")
+                version = dget("version")
+                state = (status, in_play, version)
+                if last_state.get(market_id) != state:
+                    last_state[market_id] = state
+
+                    mr_id.append(market_id)
+                    mr_pt.append(publish_time)
+                    mr_status.append(status)
+                    mr_inplay.append(in_play)
+                    mr_nar.append(dget("numberOfActiveRunners"))
+                    mr_tm.append(dget("totalMatched"))
+                    mr_ver.append(version)
+
+                if market_id not in market_meta:
+                    market_meta[market_id] = (
+                        market_id,
+                        dget("eventId"),
+                        dget("eventName"),
+                        dget("eventTypeId"),
+                        dget("name"),
+                        dget("marketType"),
+                        dget("marketTime"),
+                        dget("venue"),
+                        dget("countryCode"),
+                        dget("numberOfWinners"),
+                    )
+
+                runners = dget("runners")
+                if runners is not None:
+                    for runner in runners:
+                        rget = runner.get
+                        runner_id = rget("id")
+                        runner_name = rget("name")
+
+                        runner_key = (market_id, runner_id)
+                        if runner_key not in runner_meta:
+                            runner_meta[runner_key] = runner_name
+
+                        runner_status = rget("status")
+                        if (
+                            runner_key not in last_state
+                            or last_state[runner_key] != runner_status
+                        ):
+                            last_state[runner_key] = runner_status
+
+                            rs_mid.append(market_id)
+                            rs_pt.append(publish_time)
+                            rs_id.append(runner_id)
+                            rs_name.append(runner_name)
+                            rs_status.append(runner_status)
+                            rs_removal.append(rget("removalDate"))
+
+            rcs = mget("rc")
+            if rcs is not None:
+                for rc in rcs:
+                    g = rc.get
+                    rc_mid.append(market_id)
+                    rc_pt.append(publish_time)
+                    rc_id.append(g("id"))
+                    rc_ltp.append(g("ltp"))
+                    rc_tv.append(g("tv"))
+                    rc_batb.append(g("batb"))
+                    rc_batl.append(g("batl"))
+                    rc_spn.append(g("spn"))
+                    rc_spf.append(g("spf"))
+
+
+def _empty_columns(columns):
+    return tuple([] for _ in columns)
+
+
+def _open_bz2(file_path, threads=1):
+    if indexed_bzip2 is None:
+        return bz2.open(file_path, "rb")
+    # indexed_bzip2 decodes bz2 blocks on a thread pool; the large buffer
+    # keeps line iteration from issuing many small reads against it.
+    raw = indexed_bzip2.open(str(file_path), parallelization=threads)
+    return io.BufferedReader(raw, buffer_size=4 << 20)
+
+
+def parse_betfair_stream(file_path, threads=1):
+    markets = _empty_columns(MARKET_COLUMNS)
+    runner_static = _empty_columns(RUNNER_STATIC_COLUMNS)
+    runner_changes = _empty_columns(RUNNER_CHANGE_COLUMNS)
+    market_meta = {}
+    runner_meta = {}
+
+    with _open_bz2(file_path, threads) as f:
+        _parse_records(
+            map(orjson.loads, f),
+            markets,
+            runner_static,
+            runner_changes,
+            market_meta,
+            runner_meta,
+        )
+
+    return markets, runner_static, runner_changes, market_meta, runner_meta
+
 
-def read_betfair_bz2(file_path):
+def _process_one_file(file_path, threads=1):
     try:
-        df = pd.read_json(
-            file_path, compression="bz2", lines=True, dtype={"clk": str, "pt": "Int64"}
+        markets, runner_static, runner_changes, market_meta, runner_meta = (
+            parse_betfair_stream(file_path, threads)
         )
-        return df
+        # Convert to typed Arrow here so a malformed value only drops its file.
+        runner_changes = _runner_change_table(runner_changes)
+        return markets, runner_static, runner_changes, market_meta, runner_meta
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return pd.DataFrame()
+        print(f"    Error processing {file_path.name}: {e}")
+        return None
 
 
-def parse_betfair_stream(df):
-    if df.empty:
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+def _extend_columns(dst, src):
+    for d, s in zip(dst, src):
+        d.extend(s)
 
-    market_records = []
-    runner_static_records = []
-    runner_change_records = []
 
-    for row in df.itertuples():
-        if not hasattr(row, "mc"):
-            continue
+def _publish_times(pt):
+    return pd.to_datetime(pd.array(pt, dtype="Int64"), unit="ms")
 
-        try:
-            if pd.isna(row.mc):
-                continue
-        except (ValueError, TypeError):
-            pass
 
-        mc_data = row.mc if isinstance(row.mc, list) else [row.mc]
-        if not mc_data:
-            continue
+def _string_categories(values):
+    # String categories keep the shard schema fixed even when a day only has
+    # missing values, which would otherwise be written as a null/double column.
+    return pd.Categorical(pd.array(values, dtype="string"))
 
-        publish_time = pd.to_datetime(row.pt, unit="ms") if hasattr(row, "pt") else None
 
-        for market in mc_data:
-            market_id = market.get("id")
-
-            if "marketDefinition" in market:
-                mkt_def = market["marketDefinition"]
-
-                market_records.append(
-                    {
-                        "market_id": market_id,
-                        "publish_time": publish_time,
-                        "status": mkt_def.get("status"),
-                        "in_play": mkt_def.get("inPlay"),
-                        "number_of_active_runners": mkt_def.get(
-                            "numberOfActiveRunners"
-                        ),
-                        "total_matched": mkt_def.get("totalMatched"),
-                        "version": mkt_def.get("version"),
-                    }
+def _market_frame(columns):
+    mr_id, mr_pt, mr_status, mr_inplay, mr_nar, mr_tm, mr_ver = columns
+    return pd.DataFrame(
+        {
+            "market_id": mr_id,
+            "publish_time": _publish_times(mr_pt),
+            "status": _string_categories(mr_status),
+            # Nullable dtypes so a field missing from a definition stays null
+            # instead of failing the month or reading as False.
+            "in_play": pd.array(mr_inplay, dtype="boolean"),
+            "number_of_active_runners": pd.array(mr_nar, dtype="Int16"),
+            "total_matched": np.asarray(mr_tm, dtype="float64"),
+            "version": pd.array(mr_ver, dtype="Int64"),
+        }
+    )
+
+
+def _runner_static_frame(columns):
+    rs_mid, rs_pt, rs_id, rs_name, rs_status, rs_removal = columns
+    return pd.DataFrame(
+        {
+            "market_id": rs_mid,
+            "publish_time": _publish_times(rs_pt),
+            "runner_id": pd.array(rs_id, dtype="UInt32"),
+            "runner_name": pd.array(rs_name, dtype="string"),
+            "status": _string_categories(rs_status),
+            # Pin the unit so shards without any removals still share a schema.
+            "removal_date": pd.to_datetime(
+                rs_removal, errors="coerce", cache=True, utc=True
+            ).as_unit("ms"),
+        }
+    )
+
+
+def _runner_change_table(columns):
+    return pa.Table.from_arrays(
+        [
+            pa.array(column, type=field.type)
+            for column, field in zip(columns, RUNNER_CHANGE_SCHEMA)
+        ],
+        schema=RUNNER_CHANGE_SCHEMA,
+    )
+
+
+def _merge_meta(dst, src):
+    # Keep the first definition seen for each key, as the per-file parse does.
+    for key, value in src.items():
+        if key not in dst:
+            dst[key] = value
+
+
+def _as_categories(df, columns):
+    return df.astype({c: "category" for c in columns})
+
+
+def _reference_tables(market_meta, runner_meta):
+    if market_meta:
+        market_ref = pd.DataFrame.from_records(
+            list(market_meta.values()), columns=MARKET_REFERENCE_COLUMNS
+        )
+        market_ref["market_time"] = pd.to_datetime(
+            market_ref["market_time"], errors="coerce", cache=True, utc=True
+        )
+        market_ref = _as_categories(market_ref, MARKET_REFERENCE_CATEGORIES)
+        market_ref["number_of_winners"] = market_ref["number_of_winners"].astype(
+            "Int16"
+        )
+    else:
+        market_ref = pd.DataFrame()
+
+    if runner_meta:
+        runner_ref = pd.DataFrame(
+            {
+                "market_id": [mid for mid, _ in runner_meta],
+                "runner_id": pd.array([rid for _, rid in runner_meta], dtype="UInt32"),
+                "runner_name": list(runner_meta.values()),
+            }
+        )
+    else:
+        runner_ref = pd.DataFrame()
+
+    return market_ref, runner_ref
+
+
+def _sql_path(path):
+    return "'" + Path(path).as_posix().replace("'", "''") + "'"
+
+
+def _dedupe_shards(shard_dir, out_file, keys):
+    if not any(shard_dir.glob("*.parquet")):
+        return
+
+    with duckdb.connect() as con:
+        con.execute(f"""
+            COPY (
+                SELECT *
+                FROM read_parquet(
+                    {_sql_path(shard_dir / "*.parquet")}, union_by_name = true
                 )
+                QUALIFY row_number() OVER (
+                    PARTITION BY {", ".join(keys)} ORDER BY publish_time
+                ) = 1
+                ORDER BY market_id, publish_time
+            ) TO {_sql_path(out_file)} (
+                FORMAT PARQUET,
+                COMPRESSION ZSTD,
+                COMPRESSION_LEVEL 3,
+                ROW_GROUP_SIZE 50000
+            )
+            """)
+
+
+def _write_shard(df, shard_file):
+    if df.empty:
+        shard_file.unlink(missing_ok=True)
+        return False
+    df.to_parquet(shard_file, index=False, **_PQ_OPTS)
+    return True
+
+
+def _read_shards(shard_dir):
+    shard_files = sorted(shard_dir.glob("*.parquet"))
+    if not shard_files:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(f) for f in shard_files], ignore_index=True)
 
-                if "runners" in mkt_def:
-                    for runner in mkt_def["runners"]:
-                        runner_static_records.append(
-                            {
-                                "market_id": market_id,
-                                "publish_time": publish_time,
-                                "runner_id": runner.get("id"),
-                                "runner_name": runner.get("name"),
-                                "status": runner.get("status"),
-                                "removal_date": (
-                                    pd.to_datetime(runner.get("removalDate"))
-                                    if runner.get("removalDate")
-                                    else None
-                                ),
-                            }
-                        )
-
-            if "rc" in market:
-                for rc in market["rc"]:
-                    runner_change_records.append(
-                        {
-                            "market_id": market_id,
-                            "publish_time": publish_time,
-                            "runner_id": rc.get("id"),
-                            "ltp": rc.get("ltp"),
-                            "tv": rc.get("tv"),
-                            "batb": rc.get("batb"),
-                            "batl": rc.get("batl"),
-                            "spn": rc.get("spn"),
-                            "spf": rc.get("spf"),
-                        }
-                    )
 
+def _day_signature(bz2_files, month_path):
+    signature = {}
+    for file_path in bz2_files:
+        stat = file_path.stat()
+        signature[file_path.relative_to(month_path).as_posix()] = [
+            stat.st_size,
+            stat.st_mtime_ns,
+        ]
+    return signature
+
+
+def _load_manifest(manifest_file):
+    if manifest_file.exists():
+        manifest = orjson.loads(manifest_file.read_bytes())
+        if manifest.get("format") == MANIFEST_FORMAT:
+            return manifest
+    return {"format": MANIFEST_FORMAT, "days": {}}
+
+
+def _day_is_current(entry, signature, output_path):
+    # A day is only skipped if its raw files are unchanged and every output it
+    # produced is still on disk.
     return (
-        pd.DataFrame(market_records),
-        pd.DataFrame(runner_static_records),
-        pd.DataFrame(runner_change_records),
+        entry is not None
+        and entry["inputs"] == signature
+        and all((output_path / f).exists() for f in entry["outputs"])
     )
 
 
-def create_reference_tables(df_list):
-    market_metadata = []
-    runner_metadata = []
+def _prune_outputs(manifest, output_path, shards_path, day_names, year, month):
+    # Drop outputs of day folders that no longer exist so they aren't merged.
+    shard_names = {f"{int(day):02d}.parquet" for day in day_names}
+    for shard_dir in SHARD_DIRS:
+        for shard_file in (shards_path / shard_dir).glob("*.parquet"):
+            if shard_file.name not in shard_names:
+                shard_file.unlink()
 
-    for df in df_list:
-        if df.empty:
-            continue
+    daily_names = {f"runner_prices_{year}_{month}_{day}.parquet" for day in day_names}
+    for daily_file in (output_path / "daily_prices").glob("*.parquet"):
+        if daily_file.name not in daily_names:
+            daily_file.unlink()
 
-        for row in df.itertuples():
-            if not hasattr(row, "mc"):
-                continue
+    for day in list(manifest["days"]):
+        if day not in day_names:
+            del manifest["days"][day]
 
-            try:
-                if pd.isna(row.mc):
-                    continue
-            except (ValueError, TypeError):
-                pass
 
-            mc_data = row.mc if isinstance(row.mc, list) else [row.mc]
-            if not mc_data:
-                continue
+def _save_manifest(manifest_file, manifest):
+    tmp_file = manifest_file.with_suffix(".tmp")
+    tmp_file.write_bytes(orjson.dumps(manifest))
+    os.replace(tmp_file, manifest_file)
 
-            for market in mc_data:
-                if "marketDefinition" not in market:
-                    continue
 
-                mkt_def = market["marketDefinition"]
-                market_id = market.get("id")
-
-                market_metadata.append(
-                    {
-                        "market_id": market_id,
-                        "event_id": mkt_def.get("eventId"),
-                        "event_name": mkt_def.get("eventName"),
-                        "event_type_id": mkt_def.get("eventTypeId"),
-                        "market_name": mkt_def.get("name"),
-                        "market_type": mkt_def.get("marketType"),
-                        "market_time": (
-                            pd.to_datetime(mkt_def.get("marketTime"))
-                            if mkt_def.get("marketTime")
-                            else None
-                        ),
-                        "venue": mkt_def.get("venue"),
-                        "country_code": mkt_def.get("countryCode"),
-                        "number_of_winners": mkt_def.get("numberOfWinners"),
-                    }
-                )
+def _finish_writes(pending_writes, manifest, manifest_file, wait=False):
+    # Days are only recorded in the manifest once their price file is on disk.
+    # At most one write is left in flight so queued tables can't pile up.
+    while pending_writes:
+        day, entry, write = pending_writes[0]
+        if write is not None and not (wait or write.done() or len(pending_writes) > 1):
+            break
+        if write is not None:
+            write.result()
+        pending_writes.pop(0)
+        if entry is not None:
+            manifest["days"][day] = entry
+            _save_manifest(manifest_file, manifest)
+
 
-                if "runners" in mkt_def:
-                    for runner in mkt_def["runners"]:
-                        runner_metadata.append(
-                            {
-                                "market_id": market_id,
-                                "runner_id": runner.get("id"),
-                                "runner_name": runner.get("name"),
-                            }
-                        )
-
-    market_ref = (
-        pd.DataFrame(market_metadata).drop_duplicates(subset=["market_id"])
-        if market_metadata
-        else pd.DataFrame()
+def _merge_month(shards_path, output_path):
+    print("\n  Creating monthly reference tables...")
+    market_ref = _read_shards(shards_path / "market_reference")
+    runner_ref = _read_shards(shards_path / "runner_reference")
+
+    if not market_ref.empty:
+        # Day shards carry different category sets, so concat falls back to
+        # strings; re-encode once the month is combined.
+        market_ref = _as_categories(
+            market_ref.drop_duplicates(subset=["market_id"]),
+            MARKET_REFERENCE_CATEGORIES,
+        )
+
+    if not runner_ref.empty:
+        runner_ref = runner_ref.drop_duplicates(subset=["market_id", "runner_id"])
+
+    print("  Combining monthly aggregates...")
+    _dedupe_shards(
+        shards_path / "markets",
+        output_path / "market_timeline.parquet",
+        ["market_id", "status", "in_play", "version"],
     )
-    runner_ref = (
-        pd.DataFrame(runner_metadata).drop_duplicates(subset=["market_id", "runner_id"])
-        if runner_metadata
-        else pd.DataFrame()
+    _dedupe_shards(
+        shards_path / "runner_status",
+        output_path / "runner_status.parquet",
+        ["market_id", "runner_id", "status"],
     )
 
+    if not market_ref.empty:
+        market_ref.to_parquet(
+            output_path / "market_reference.parquet", index=False, **_PQ_OPTS
+        )
+
+    if not runner_ref.empty:
+        runner_ref.to_parquet(
+            output_path / "runner_reference.parquet", index=False, **_PQ_OPTS
+        )
+
     return market_ref, runner_ref
 
 
-def get_folder_size(folder_path):
+def get_folder_size(folder_path, exclude=()):
     total_size = 0
-    for dirpath, _, filenames in os.walk(folder_path):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            if not os.path.islink(filepath):
-                total_size += os.path.getsize(filepath)
+    stack = [folder_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name in exclude:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif not entry.is_symlink():
+                    total_size += entry.stat(follow_symlinks=False).st_size
 
     size_mb = total_size / (1024 * 1024)
     print(f"Total size of '{folder_path}': {size_mb:.2f} MB")
 
 
-def process_month(base_path, output_dir, year, month):
+def process_month(base_path, output_dir, year, month, workers=None):
     """
     Process Betfair data for a given month.
     Parameters:
@@ -190,9 +516,14 @@ def process_month(base_path, output_dir, year, month):
     - output_dir: str or Path, directory to save processed data
     - year: int, year to process (e.g., 2024)
     - month: str, month to process (e.g., 'Dec')
+    - workers: int, number of parsing processes (default: os.cpu_count())
     Returns:
     - dict with summary of processed data
     - saves processed files to output_dir
+    Note:
+    - the parsing pool recycles workers (max_tasks_per_child), which makes it
+      use the spawn start method; spawned workers re-import the caller's main
+      module, so call this under an `if __name__ == "__main__":` guard
     """
     base_path = Path(base_path)
     month_path = base_path / str(year) / month
@@ -208,96 +539,131 @@ def process_month(base_path, output_dir, year, month):
     )
     print(f"Processing {year}/{month} - found {len(days)} days")
 
-    all_markets = []
-    all_runner_static = []
-    all_raw_dfs = []
-
-    for day_path in days:
-        day = day_path.name
+    # Per-day shards and the manifest persist between runs, so days whose raw
+    # files are unchanged since the last successful run are skipped.
+    shards_path = output_path / "_shards"
+    for shard_dir in SHARD_DIRS:
+        (shards_path / shard_dir).mkdir(parents=True, exist_ok=True)
 
-        bz2_files = list(day_path.rglob("*.bz2"))
-
-        day_runner_changes = []
-
-        batch_size = 100
-        for i in range(0, len(bz2_files), batch_size):
-            batch = bz2_files[i : i + batch_size]
-
-            for file_path in batch:
-                try:
-                    df = read_betfair_bz2(file_path)
-                    if df.empty:
-                        continue
+    manifest_file = output_path / "_manifest.json"
+    manifest = _load_manifest(manifest_file)
+    _prune_outputs(
+        manifest, output_path, shards_path, {d.name for d in days}, year, month
+    )
 
-                    all_raw_dfs.append(df)
-                    m, rs, rc = parse_betfair_stream(df)
+    workers = workers or os.cpu_count()
+    # Spare cores go to block-parallel bz2 decoding within each file.
+    process_one_file = partial(
+        _process_one_file, threads=max(1, os.cpu_count() // workers)
+    )
 
-                    if not m.empty:
-                        all_markets.append(m)
-                    if not rs.empty:
-                        all_runner_static.append(rs)
-                    if not rc.empty:
-                        day_runner_changes.append(rc)
+    # Daily price files are written on a background thread while the next day
+    # parses; pyarrow releases the GIL while encoding.
+    pending_writes = []
+
+    with (
+        ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=64) as executor,
+        ThreadPoolExecutor(max_workers=1) as io_pool,
+    ):
+        for day_path in days:
+            day = day_path.name
+
+            bz2_files = sorted(day_path.rglob("*.bz2"))
+            signature = _day_signature(bz2_files, month_path)
+            if _day_is_current(manifest["days"].get(day), signature, output_path):
+                print(f"  Skipping day {day} - unchanged since last run")
+                continue
 
-                except Exception as e:
-                    print(f"    Error processing {file_path.name}: {e}")
+            day_markets = _empty_columns(MARKET_COLUMNS)
+            day_runner_static = _empty_columns(RUNNER_STATIC_COLUMNS)
+            # Seeded with an empty table so a day whose files all fail still concats.
+            day_runner_changes = [RUNNER_CHANGE_SCHEMA.empty_table()]
+            market_meta = {}
+            runner_meta = {}
+            failed = False
+
+            for result in executor.map(process_one_file, bz2_files, chunksize=8):
+                if result is None:
+                    failed = True
                     continue
-
-        if day_runner_changes:
-            daily_prices = pd.concat(day_runner_changes, ignore_index=True)
-            daily_prices = daily_prices.sort_values(["market_id", "publish_time"])
+                m, rs, rc, mm, rm = result
+                _extend_columns(day_markets, m)
+                _extend_columns(day_runner_static, rs)
+                day_runner_changes.append(rc)
+                _merge_meta(market_meta, mm)
+                _merge_meta(runner_meta, rm)
+
+            # Spill the monthly aggregates to per-day shards so only one day
+            # is ever held in memory.
+            shard_name = f"{int(day):02d}.parquet"
+            market_ref, runner_ref = _reference_tables(market_meta, runner_meta)
+            day_shards = {
+                "markets": _market_frame(day_markets),
+                "runner_status": _runner_static_frame(day_runner_static),
+                "market_reference": market_ref,
+                "runner_reference": runner_ref,
+            }
+            outputs = []
+            for shard_dir, df in day_shards.items():
+                shard_file = shards_path / shard_dir / shard_name
+                if _write_shard(df, shard_file):
+                    outputs.append(shard_file)
+            del day_markets, day_runner_static, market_meta, runner_meta
+            del day_shards, market_ref, runner_ref
 
             daily_file = (
                 output_path
                 / "daily_prices"
                 / f"runner_prices_{year}_{month}_{day}.parquet"
             )
-            daily_file.parent.mkdir(exist_ok=True)
-            daily_prices.to_parquet(daily_file, index=False)
-
-    print("\n  Creating monthly reference tables...")
-    market_ref, runner_ref = create_reference_tables(all_raw_dfs)
-
-    print("  Combining monthly aggregates...")
-    combined_markets = (
-        pd.concat(all_markets, ignore_index=True) if all_markets else pd.DataFrame()
-    )
-    combined_runner_static = (
-        pd.concat(all_runner_static, ignore_index=True)
-        if all_runner_static
-        else pd.DataFrame()
-    )
-
-    if not combined_markets.empty:
-        combined_markets = combined_markets.drop_duplicates(
-            subset=["market_id", "status", "in_play", "version"], keep="first"
-        ).sort_values(["market_id", "publish_time"])
-
-    if not combined_runner_static.empty:
-        combined_runner_static = combined_runner_static.drop_duplicates(
-            subset=["market_id", "runner_id", "status"], keep="first"
-        ).sort_values(["market_id", "publish_time"])
-
-    if not market_ref.empty:
-        market_ref.to_parquet(output_path / "market_reference.parquet", index=False)
-
-    if not runner_ref.empty:
-        runner_ref.to_parquet(output_path / "runner_reference.parquet", index=False)
-
-    if not combined_markets.empty:
-        combined_markets.to_parquet(
-            output_path / "market_timeline.parquet", index=False
-        )
+            daily_prices = pa.concat_tables(day_runner_changes)
+            del day_runner_changes
+            if daily_prices.num_rows:
+                # Each file's rows arrive as a typed table; the day's tables are
+                # combined and sorted once.
+                daily_prices = daily_prices.sort_by(
+                    [("market_id", "ascending"), ("publish_time", "ascending")]
+                )
+                daily_file.parent.mkdir(exist_ok=True)
+                write = io_pool.submit(
+                    pq.write_table,
+                    daily_prices,
+                    daily_file,
+                    data_page_size=1 << 20,
+                    **_PQ_OPTS,
+                )
+                del daily_prices
+                outputs.append(daily_file)
+            else:
+                daily_file.unlink(missing_ok=True)
+                write = None
+
+            # Days with unreadable files are retried on the next run.
+            entry = None
+            if not failed:
+                entry = {
+                    "inputs": signature,
+                    "outputs": [f.relative_to(output_path).as_posix() for f in outputs],
+                }
+            pending_writes.append((day, entry, write))
+            _finish_writes(pending_writes, manifest, manifest_file)
+
+        _finish_writes(pending_writes, manifest, manifest_file, wait=True)
 
-    if not combined_runner_static.empty:
-        combined_runner_static.to_parquet(
-            output_path / "runner_status.parquet", index=False
-        )
+    try:
+        market_ref, runner_ref = _merge_month(shards_path, output_path)
+    except Exception:
+        # The days are already recorded as done; forget them so the next run
+        # rebuilds their shards instead of skipping straight to a failing merge.
+        manifest["days"].clear()
+        _save_manifest(manifest_file, manifest)
+        raise
 
     daily_files = list((output_path / "daily_prices").glob("*.parquet"))
 
     print(f"\nProcessing complete for {year}/{month}:")
-    get_folder_size(output_path)
+    # The shards and manifest are working state, not part of the output.
+    get_folder_size(output_path, exclude=(shards_path.name, manifest_file.name))
 
     return {
         "year": year,
@@ -309,7 +675,17 @@ def process_month(base_path, output_dir, year, month):
 
 
 if __name__ == "__main__":
-    process_month("data/raw_data", year=2024, month="Dec", output_dir="data/proc_data")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    process_month(
+        "data/raw_data",
+        year=2024,
+        month="Dec",
+        output_dir="data/proc_data",
+        workers=args.workers,
+    )
 
     # Output structure will be:
     # processed/
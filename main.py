@@ -1,6 +1,8 @@
+import argparse
+
 from clean_data import process_month
 
-def main():
+def main(workers=None):
     raw_data_dir = 'data/raw_data'
     processed_data_dir = 'data/proc_data'
     
@@ -11,12 +13,15 @@ def main():
     
     for y in years:
         for m in months:
-            res = process_month(base_path=raw_data_dir, month=m, year=y, output_dir=processed_data_dir)
+            res = process_month(base_path=raw_data_dir, month=m, year=y, output_dir=processed_data_dir, workers=workers)
             if res is not None:
                 print(res)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    main(workers=args.workers)
 
 
 